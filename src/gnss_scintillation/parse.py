@@ -1,5 +1,10 @@
+import io
 import gzip
-from struct import unpack
+import zlib
+import binascii
+import warnings
+from collections import deque
+from struct import unpack, error
 import numpy as np
 #from .utils import twos_comp
 
@@ -11,6 +16,196 @@ def twos_comp(val, bits):
     return val                         # return positive value as is
 
 
+class BlockFramer:
+# Split a raw receiver byte stream into complete binary blocks
+# Data can be fed in arbitrarily sized chunks; partial blocks are held until the rest arrives
+# Blocks that fail the CRC check are dropped and the framer resynchronizes on the next sync pattern
+# bad_blocks counts blocks with a plausible length that failed the CRC check or were truncated;
+# sync patterns that occur by chance in other data only add to bytes_skipped
+
+    # Sync pattern at the start of every block
+    sync = {'novatel': b'\xaa\x44\x12',
+            'septentrio': b'$@'}
+
+    # Minimum number of bytes needed to determine the block length
+    min_header = {'novatel': 10,
+                  'septentrio': 8}
+
+    def __init__(self, receiver, max_skipped=1000):
+        '''
+        Input
+        -----
+        receiver: receiver type, either 'novatel' or 'septentrio'
+        max_skipped: number of most recent skipped sections to keep in self.skipped; all if None (default=1000)
+        '''
+
+        if receiver not in self.sync:
+            raise ValueError(f'receiver={receiver} is not a valid receiver option')
+
+        self.receiver = receiver
+        self.buffer = bytearray()
+        self.offset = 0             # stream position of the start of the buffer
+        self.bad_blocks = 0
+        self.bytes_skipped = 0
+        self.skipped = deque(maxlen=max_skipped)    # (stream position, number of bytes) of each skipped section
+
+
+    def feed(self, data):
+        '''
+        Add raw bytes to the buffer and return any blocks that are now complete.
+
+        Input
+        -----
+        data: bytes read from the receiver stream or file
+
+        Returns
+        -------
+        blocks: list of complete blocks (bytes) that passed the CRC check, each starting with the sync pattern
+        '''
+
+        self.buffer.extend(data)
+        sync = self.sync[self.receiver]
+
+        blocks = list()
+        pos = 0
+        while True:
+
+            # Find start of next block
+            start = self.buffer.find(sync, pos)
+            if start < 0:
+                # Keep trailing bytes that could be the start of a split sync pattern
+                start = max(pos, len(self.buffer)-len(sync)+1)
+                self.skip(pos, start-pos)
+                pos = start
+                break
+            self.skip(pos, start-pos)
+            pos = start
+
+            if len(self.buffer) - pos < self.min_header[self.receiver]:
+                break
+            length = self.block_length(pos)
+            if length is not None and len(self.buffer) - pos < length:
+                break
+
+            if length is None or not self.check_crc(pos, length):
+                # Corrupt block or false sync, so search again just past this sync pattern
+                if length is not None:
+                    self.bad_blocks += 1
+                self.skip(pos, len(sync))
+                pos += len(sync)
+                continue
+
+            blocks.append(bytes(self.buffer[pos:pos+length]))
+            pos += length
+
+        # Only compact the buffer once per call
+        del self.buffer[:pos]
+        self.offset += pos
+
+        return blocks
+
+
+    def flush(self):
+        '''
+        Treat any incomplete block left in the buffer as truncated and return the blocks that follow it.
+        Call once the stream or file has ended.
+        '''
+
+        sync = self.sync[self.receiver]
+
+        blocks = list()
+        while self.buffer:
+            start = self.buffer.find(sync)
+            if start < 0:
+                self.skip(0, len(self.buffer))
+                self.offset += len(self.buffer)
+                self.buffer.clear()
+                break
+
+            # Drop the truncated block's sync pattern and frame the rest again
+            if len(self.buffer) - start >= self.min_header[self.receiver] and self.block_length(start) is not None:
+                self.bad_blocks += 1
+            self.skip(0, start+len(sync))
+            del self.buffer[:start+len(sync)]
+            self.offset += start+len(sync)
+            blocks.extend(self.feed(b''))
+
+        return blocks
+
+
+    def read(self, fp, chunk_size=1048576):
+        '''
+        Generator yielding every valid block in an open file.
+
+        Input
+        -----
+        fp: file object opened in binary mode
+        chunk_size: number of bytes read from the file at once (default=1048576)
+        '''
+
+        while True:
+            data = fp.read(chunk_size)
+            if not data:
+                break
+            yield from self.feed(data)
+
+        yield from self.flush()
+
+
+    def skip(self, pos, n):
+        # Record n bytes skipped at buffer position pos, merging with the previous section if adjacent
+
+        if n <= 0:
+            return
+
+        self.bytes_skipped += n
+        start = self.offset + pos
+        if self.skipped and sum(self.skipped[-1]) == start:
+            self.skipped[-1] = (self.skipped[-1][0], self.skipped[-1][1]+n)
+        else:
+            self.skipped.append((start, n))
+
+
+    def block_length(self, pos):
+        # Total length of the block starting at pos, including header and CRC
+        # Returns None if the length field cannot be valid
+
+        if self.receiver == 'novatel':
+            # Binary header is 28 bytes, so anything shorter is not a real header
+            HeaderLength = self.buffer[pos+3]
+            if HeaderLength < 28:
+                return None
+            MessageLength, = unpack('=H', self.buffer[pos+8:pos+10])
+            return HeaderLength + MessageLength + 4
+
+        else:
+            # SBF length field already includes the header and is always a multiple of 4
+            length, = unpack('=H', self.buffer[pos+6:pos+8])
+            if length < 8 or length % 4:
+                return None
+            return length
+
+
+    def check_crc(self, pos, length):
+        # Validate the CRC of the block starting at pos
+
+        block = memoryview(self.buffer)[pos:pos+length]
+        try:
+            if self.receiver == 'novatel':
+                # CRC-32 over header and message, appended to the end of the block
+                # Novatel starts from 0 with no final XOR, which zlib's CRC-32 can reproduce
+                crc, = unpack('=L', block[-4:])
+                return zlib.crc32(block[:-4], 0xFFFFFFFF) ^ 0xFFFFFFFF == crc
+
+            else:
+                # CRC-16 (CCITT) over everything after the CRC field
+                crc, = unpack('=H', block[2:4])
+                return binascii.crc_hqx(block[4:], 0) == crc
+        finally:
+            block.release()
+
+
+
 class ParseNovatel:
 # Parser for Novatel files
 # Reference Document: https://chain-new.chain-project.net/docs/Novatel/Gsv4004BManualFeb_07.pdf
@@ -36,48 +231,54 @@ class ParseNovatel:
         self.azimuth = {prn:list() for prn in range(32)}
         self.elevation = {prn:list() for prn in range(32)}
     
+        # Blocks that fail the CRC check are skipped
+        self.decode_errors = 0
+        framer = BlockFramer('novatel', max_skipped=None)
         with gzip.open(filename, 'rb') as f:
     
-            while True:
+            for block in framer.read(f):
     
                 # Read Header
-                try:
-                    block_id, block_length, wnc, tow = self.read_header(f)
-                    #print(block_id)
-                except EOFError:
-                    # At EOF, exit while loop
-                    break
+                fp = io.BytesIO(block)
+                block_id, block_length, wnc, tow = self.read_header(fp)
         
                 # read block
-                if block_id == 327:
-                    adr, pwr, tec0, dtec0 = self.read327(f)
+                try:
+                    if block_id == 327:
+                        adr, pwr, tec0, dtec0 = self.read327(fp)
         
-                    # organize output from block
-                    self.tstmp_wnc.extend(np.full(50, wnc))
-                    self.tstmp_tow.extend(tow+np.arange(0., 1000., 20.))
+                        # organize output from block
+                        self.tstmp_wnc.extend(np.full(50, wnc))
+                        self.tstmp_tow.extend(tow+np.arange(0., 1000., 20.))
     
-                    self.tstmp_tec_wnc.append(wnc)
-                    self.tstmp_tec_tow.append(tow)
+                        self.tstmp_tec_wnc.append(wnc)
+                        self.tstmp_tec_tow.append(tow)
     
-                    for prn in range(32):
-                        self.phase[prn].extend(adr[prn-1,:])
-                        self.power[prn].extend(pwr[prn-1,:])
-                        self.tec[prn].append(tec0[prn-1])
-                        self.dtec[prn].append(dtec0[prn-1])
+                        for prn in range(32):
+                            self.phase[prn].extend(adr[prn-1,:])
+                            self.power[prn].extend(pwr[prn-1,:])
+                            self.tec[prn].append(tec0[prn-1])
+                            self.dtec[prn].append(dtec0[prn-1])
 
-                elif block_id == 274:
-                    az, el = self.read274(f)
+                    elif block_id == 274:
+                        az, el = self.read274(fp)
                     
-                    self.tstmp_pos_wnc.append(wnc)
-                    self.tstmp_pos_tow.append(tow)
+                        self.tstmp_pos_wnc.append(wnc)
+                        self.tstmp_pos_tow.append(tow)
         
-                    for prn in range(32):
-                        self.azimuth[prn].append(az[prn-1])
-                        self.elevation[prn].append(el[prn-1])
-
-                else:
-                    # skip block
-                    f.read(block_length)
+                        for prn in range(32):
+                            self.azimuth[prn].append(az[prn-1])
+                            self.elevation[prn].append(el[prn-1])
+                except (error, IndexError, KeyError):
+                    # Passed the CRC check but could not be decoded (e.g. non-GPS satellite)
+                    self.decode_errors += 1
+
+        # report corrupt sections of the file
+        self.bad_blocks = framer.bad_blocks
+        self.bytes_skipped = framer.bytes_skipped
+        self.skipped = list(framer.skipped)
+        if self.bytes_skipped or self.decode_errors:
+            warnings.warn(f'{filename}: skipped {self.bytes_skipped} bytes ({self.bad_blocks} corrupt or truncated blocks) and {self.decode_errors} blocks that could not be decoded', stacklevel=2)
 
    
         # Any final organization?
@@ -92,7 +293,8 @@ class ParseNovatel:
 #            return tstmp_wnc, tstmp_tow, phase, power
 
 
-    def read_header(self, fp):
+    @staticmethod
+    def read_header(fp):
     
         header = fp.read(28)
         
@@ -105,7 +307,8 @@ class ParseNovatel:
         return MessageID, MessageLength+4, wnc, tow
     
     
-    def read327(self, f):
+    @staticmethod
+    def read327(f):
         
         block_data = dict()
     
@@ -137,7 +340,8 @@ class ParseNovatel:
         
         return adr, pwr, tec, dtec
 
-    def read274(self, f):
+    @staticmethod
+    def read274(f):
         
         # read nubmer of PRNs
         data = f.read(4)
@@ -187,6 +391,14 @@ class ParseNovatel:
 
 
 
+# Septentrio signal types (see SBF Reference Guide)
+signal_type = {0 : {'name':'GPS_L1-CA', 'freq':1575.42*1.e6},
+               1 : {'name':'GPS_L1-P(Y)', 'freq':1575.42*1.e6},
+               2 : {'name':'GPS_L2-P(Y)', 'freq':1227.60*1.e6},
+               3 : {'name':'GPS_L2C', 'freq':1227.60*1.e6},
+               4 : {'name':'GPS_L5', 'freq':1176.45*1.e6}}
+
+
 class ParseSeptentrio:
 # Parser for Septentrio data files
 
@@ -207,42 +419,49 @@ class ParseSeptentrio:
         tstmp_tow_ME = list()
         carrier_phase_ME = list()
     
+        # Blocks that fail the CRC check are skipped
+        self.decode_errors = 0
+        framer = BlockFramer('septentrio', max_skipped=None)
         with gzip.open(filename, 'rb') as f:
     
             # Read through all blocks to end of file
-            while True:
+            for block in framer.read(f):
     
                 # Read Header
-                try:
-                    block_id, block_length = self.read_header(f)
-                except EOFError:
-                    # At EOF, exit while loop
-                    break
+                fp = io.BytesIO(block)
+                block_id, block_length = self.read_header(fp)
     
     
                 # read block
-                if block_id == 4046:
-                    tow, wnc, I, Q, cp = self.read4046(f)
-        
-                    # organize output from block
-                    self.tstmp_wnc.append(wnc)
-                    self.tstmp_tow.append(tow)
-    
-                    for prn in range(32):
-                        for st, sig_info in signal_type.items():
-                            self.power[prn][sig_info['name']].append(I[prn,st]**2 + Q[prn,st]**2)
-                            self.phase[prn][sig_info['name']].append(cp[prn,st])
-    
-    
-                elif block_id == 4027:
-                    tow, wnc, cp = self.read4027(f)
-                    tstmp_wnc_ME.append(wnc)
-                    tstmp_tow_ME.append(tow)
-                    carrier_phase_ME.append(cp)
+                try:
+                    if block_id == 4046:
+                        tow, wnc, I, Q, cp = self.read4046(fp)
         
-                else:
-                    # skip block
-                    f.read(block_length-8)
+                        # organize output from block
+                        self.tstmp_wnc.append(wnc)
+                        self.tstmp_tow.append(tow)
+    
+                        for prn in range(32):
+                            for st, sig_info in signal_type.items():
+                                self.power[prn][sig_info['name']].append(I[prn,st]**2 + Q[prn,st]**2)
+                                self.phase[prn][sig_info['name']].append(cp[prn,st])
+    
+    
+                    elif block_id == 4027:
+                        tow, wnc, cp = self.read4027(fp)
+                        tstmp_wnc_ME.append(wnc)
+                        tstmp_tow_ME.append(tow)
+                        carrier_phase_ME.append(cp)
+                except (error, IndexError, KeyError):
+                    # Passed the CRC check but could not be decoded (e.g. non-GPS satellite)
+                    self.decode_errors += 1
+
+        # report corrupt sections of the file
+        self.bad_blocks = framer.bad_blocks
+        self.bytes_skipped = framer.bytes_skipped
+        self.skipped = list(framer.skipped)
+        if self.bytes_skipped or self.decode_errors:
+            warnings.warn(f'{filename}: skipped {self.bytes_skipped} bytes ({self.bad_blocks} corrupt or truncated blocks) and {self.decode_errors} blocks that could not be decoded', stacklevel=2)
     
         # Any final organization?
         # convert timestamps
@@ -269,7 +488,7 @@ class ParseSeptentrio:
             for st, sig_info in signal_type.items():
                 #phase[prn][sig_info['name']] = np.unwrap(phase[prn][sig_info['name']], period=65.536)
                 for i in range(len(carrier_phase_ME)):
-                    self.phase[prn][sig_info['name']][i*100:(i+1)*100] = np.unwrap(phase[prn][sig_info['name']][i*100:(i+1)*100], period=65.536) + carrier_phase_ME[i,prn,st]
+                    self.phase[prn][sig_info['name']][i*100:(i+1)*100] = np.unwrap(self.phase[prn][sig_info['name']][i*100:(i+1)*100], period=65.536) + carrier_phase_ME[i,prn,st]
     
     
         #tstmp = gps2utc(tstmp_wnc, tstmp_tow)
@@ -277,7 +496,8 @@ class ParseSeptentrio:
         #return tstmp_wnc, tstmp_tow, phase, power
     
     
-    def read_header(self, fp):
+    @staticmethod
+    def read_header(fp):
         
         header = fp.read(8)
         
@@ -291,14 +511,12 @@ class ParseSeptentrio:
      
         return id0, length
     
-    signal_type = {0 : {'name':'GPS_L1-CA', 'freq':1575.42*1.e6},
-                   1 : {'name':'GPS_L1-P(Y)', 'freq':1575.42*1.e6},
-                   2 : {'name':'GPS_L2-P(Y)', 'freq':1227.60*1.e6},
-                   3 : {'name':'GPS_L2C', 'freq':1227.60*1.e6},
-                   4 : {'name':'GPS_L5', 'freq':1176.45*1.e6}}
+    # Kept on the class for backward compatibility; the module-level signal_type is used internally
+    signal_type = signal_type
     
     
-    def read4027(self, f):
+    @staticmethod
+    def read4027(f):
         
         # read time of week (ms), week #, # of satellites, length of sat info block
         data = f.read(9)
@@ -379,7 +597,8 @@ class ParseSeptentrio:
         return tow, wnc, CarrierPhase
     
     
-    def read4046(self, fp):
+    @staticmethod
+    def read4046(fp):
     
         # read time of week (ms), week #, # of satellites, length of sat info block
         data = fp.read(8)
@@ -0,0 +1,245 @@
+# stream.py
+# Live ingest of receiver data streamed over TCP
+
+import io
+import gzip
+import struct
+import asyncio
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from .parse import BlockFramer, ParseNovatel, ParseSeptentrio
+
+
+def decode_block(block, receiver):
+    '''
+    Decode a single complete binary block with the existing parser block logic.
+
+    Input
+    -----
+    block: raw block (bytes), starting with the sync pattern
+    receiver: receiver type ('novatel' or 'septentrio')
+
+    Returns
+    -------
+    epoch: dictionary of decoded values, or None if the block type is not decoded
+        - Novatel 327: block_id, wnc, tow, phase, power, tec, dtec
+        - Novatel 274: block_id, wnc, tow, azimuth, elevation
+        - Septentrio 4046: block_id, wnc, tow, I, Q, phase
+        - Septentrio 4027: block_id, wnc, tow, phase
+
+    Notes
+    -----
+    - Arrays are indexed [prn-1] (and [prn-1, sample] or [prn-1, signal_type]) as in the parsers.
+    '''
+
+    fp = io.BytesIO(block)
+
+    if receiver == 'novatel':
+        block_id, _, wnc, tow = ParseNovatel.read_header(fp)
+        if block_id == 327:
+            adr, pwr, tec, dtec = ParseNovatel.read327(fp)
+            return dict(block_id=block_id, wnc=wnc, tow=tow, phase=adr, power=pwr, tec=tec, dtec=dtec)
+        elif block_id == 274:
+            az, el = ParseNovatel.read274(fp)
+            return dict(block_id=block_id, wnc=wnc, tow=tow, azimuth=az, elevation=el)
+
+    elif receiver == 'septentrio':
+        block_id, _ = ParseSeptentrio.read_header(fp)
+        if block_id == 4046:
+            tow, wnc, I, Q, cp = ParseSeptentrio.read4046(fp)
+            return dict(block_id=block_id, wnc=wnc, tow=tow, I=I, Q=Q, phase=cp)
+        elif block_id == 4027:
+            tow, wnc, cp = ParseSeptentrio.read4027(fp)
+            return dict(block_id=block_id, wnc=wnc, tow=tow, phase=cp)
+
+    else:
+        raise ValueError(f'receiver={receiver} is not a valid receiver option')
+
+    return None
+
+
+
+class RotatingGzipArchive:
+# Write the raw receiver stream to gzip files, starting a new file at a fixed interval
+# Files are rotated between socket reads, so a block can be split across two files;
+# the file parsers skip the partial blocks at either end
+
+    def __init__(self, pattern, interval=3600.):
+        '''
+        Input
+        -----
+        pattern: output filename as a strftime pattern in UTC (e.g. 'rx_%Y%m%d_%H%M%S.gz')
+        interval: number of seconds of data in each file (default=3600)
+        '''
+
+        self.pattern = pattern
+        self.interval = interval
+        self.fp = None
+        self.filename = None
+        self.opened = None
+
+
+    def write(self, data):
+
+        now = dt.datetime.now(dt.timezone.utc)
+        if self.fp is None or (now - self.opened).total_seconds() >= self.interval:
+            self.rotate(now)
+
+        self.fp.write(data)
+
+
+    def rotate(self, now):
+
+        self.close()
+        self.filename = now.strftime(self.pattern)
+        self.fp = gzip.open(self.filename, 'ab')
+        self.opened = now
+
+
+    def close(self):
+
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+
+
+class StreamIngest:
+# Read blocks from a receiver TCP stream and push decoded epochs onto a bounded queue
+# Every byte read is archived, but blocks that fail the CRC check are not decoded;
+# the number of bytes skipped is kept in self.framer.bytes_skipped.
+# Decoded epochs are the dictionaries returned by decode_block.  When the stream
+# closes or ingest stops, None is put on the queue to tell consumers that no more
+# epochs will arrive.
+
+    def __init__(self, host, port, receiver='novatel', maxsize=100, overflow='block', archive=None, interval=3600., chunk_size=4096):
+        '''
+        Input
+        -----
+        host: hostname or IP address of the receiver (or replay server)
+        port: TCP port the receiver is logging to
+        receiver: receiver type, either 'novatel' or 'septentrio' (default='novatel')
+        maxsize: maximum number of decoded epochs held in the queue (default=100)
+        overflow: what to do when the queue is full (default='block')
+            - 'block': stop reading from the socket until a consumer catches up
+            - 'drop': discard the oldest epoch in the queue
+        archive: strftime filename pattern for raw gzip archives; no archive if None (default=None)
+        interval: number of seconds in each archive file (default=3600)
+        chunk_size: maximum number of bytes read from the socket at once (default=4096)
+
+        Notes
+        -----
+        - With overflow='block', the socket is not read while the queue is full, so TCP flow
+          control pushes back on the sender.  Raw data is only archived once it has been read,
+          so a slow consumer delays the archive as well.
+        - Archive writes, rotation and compression run in a separate thread so a slow disk
+          does not stall the event loop; each read waits for its write before the next read.
+        - With overflow='drop', the archive always keeps up with the stream and the number of
+          discarded epochs is counted in self.dropped.
+        - Blocks that pass the CRC check but cannot be decoded (e.g. satellites outside the
+          GPS PRN range) are skipped and counted in self.decode_errors.
+        '''
+
+        if overflow not in ['block', 'drop']:
+            raise ValueError(f'overflow={overflow} is not a valid overflow option')
+
+        self.host = host
+        self.port = port
+        self.receiver = receiver
+        self.overflow = overflow
+        self.chunk_size = chunk_size
+        self.maxsize = maxsize
+        self.framer = BlockFramer(receiver)
+        self.archive = RotatingGzipArchive(archive, interval) if archive else None
+        self._queue = None
+        self.dropped = 0
+        self.decode_errors = 0
+
+
+    @property
+    def queue(self):
+        # Created on first use so it belongs to the running event loop (needed before Python 3.10)
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+        return self._queue
+
+
+    async def run(self):
+        '''
+        Connect to the receiver and ingest blocks until the connection is closed.
+        '''
+
+        loop = asyncio.get_event_loop()
+        # One worker keeps archive writes in order
+        executor = ThreadPoolExecutor(max_workers=1) if self.archive else None
+
+        writer = None
+        finished = False
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+
+            while True:
+                data = await reader.read(self.chunk_size)
+                if not data:
+                    break
+
+                if self.archive:
+                    await loop.run_in_executor(executor, self.archive.write, data)
+
+                for block in self.framer.feed(data):
+                    await self.handle(block)
+
+            # Any partial block left when the stream closes is truncated
+            for block in self.framer.flush():
+                await self.handle(block)
+
+            await self.put(None)
+            finished = True
+
+        finally:
+            if writer is not None:
+                writer.close()
+            # If ingest failed or was cancelled, never wait here so run() always finishes
+            if not finished:
+                if self.queue.full():
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                self.queue.put_nowait(None)
+
+            if self.archive:
+                # Runs after any write still in progress
+                await loop.run_in_executor(executor, self.archive.close)
+                executor.shutdown(wait=False)
+
+
+    async def handle(self, block):
+
+        try:
+            epoch = decode_block(block, self.receiver)
+        except (struct.error, IndexError, KeyError):
+            self.decode_errors += 1
+            return
+
+        if epoch is not None:
+            await self.put(epoch)
+
+
+    async def put(self, epoch):
+
+        if self.overflow == 'drop' and self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+
+        await self.queue.put(epoch)
+
+
+    async def epochs(self):
+        '''
+        Asynchronously iterate over decoded epochs as they arrive.
+        '''
+
+        while True:
+            epoch = await self.queue.get()
+            if epoch is None:
+                break
+            yield epoch
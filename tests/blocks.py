@@ -0,0 +1,61 @@
+# blocks.py
+# Build synthetic Novatel and Septentrio (SBF) blocks for the tests
+
+import zlib
+import binascii
+from struct import pack
+
+
+def novatel_block(msgid, body, wnc=2300, tow=0):
+    # 28 byte binary header, message, CRC-32
+    header = pack('=BBBBHBBHHBBHLLHH', 0xaa, 0x44, 0x12, 28, msgid, 0, 0, len(body), 0, 0, 0, wnc, tow, 0, 0, 0)
+    crc = zlib.crc32(header+body, 0xFFFFFFFF) ^ 0xFFFFFFFF
+    return header + body + pack('=L', crc)
+
+
+def novatel327(prns, tow=0):
+    body = pack('=i', len(prns))
+    for prn in prns:
+        body += pack('=hhffd', prn, 0, 10., 0.5, 100.)
+        for i in range(50):
+            body += pack('=iI', i*1000, 500+i)
+    return novatel_block(327, body, tow=tow)
+
+
+def novatel274(prns, tow=0):
+    body = pack('=i', len(prns))
+    for prn in prns:
+        body += pack('=hhff', prn, 0, 45., 30.)
+        body += pack('=10d', *range(10))
+        body += pack('=8f', *range(8))
+        body += pack('=didd', 1., 2, 3., 4.)
+    return novatel_block(274, body, tow=tow)
+
+
+def sbf_block(block_id, body):
+    # Pad to a multiple of 4, CRC-16 over ID, length and body
+    body += bytes(-(len(body)+8) % 4)
+    id_length = pack('=HH', block_id, len(body)+8)
+    crc = binascii.crc_hqx(id_length+body, 0)
+    return b'$@' + pack('=H', crc) + id_length + body
+
+
+def sbf4046(svids, tow=0):
+    body = pack('=IHBB', tow, 2300, len(svids), 8) + pack('=BBBB', 10, 0, 0, 0)
+    for svid in svids:
+        body += pack('=BBB', 0, 0, svid) + pack('=BBBH', 0x21, 5, 6, 700)
+    return sbf_block(4046, body)
+
+
+def sbf4027(svids, tow=0):
+    # One GPS L1-CA measurement per satellite: zero pseudorange, 1 cycle of carrier phase
+    body = pack('=IHBBB', tow, 2300, len(svids), 20, 0) + pack('=BBB', 0, 0, 0)
+    for svid in svids:
+        body += pack('=BBB', 0, 0, svid) + pack('=BI', 0, 0) + pack('=i', 0) + pack('=Hb', 1000, 0)
+        body += pack('=B', 0) + pack('=H', 0) + pack('=BB', 0, 0)
+    return sbf_block(4027, body)
+
+
+def novatel_stream(n):
+    # n epochs of 327 and 274 blocks, plus a block type that is not decoded
+    return b''.join(novatel327([3, 7, 12], tow=1000*k) + novatel274([3, 7], tow=1000*k) + novatel_block(99, bytes(12), tow=1000*k) for k in range(n))
@@ -0,0 +1,173 @@
+import gzip
+import pytest
+import numpy as np
+
+from gnss_scintillation.parse import BlockFramer, ParseNovatel, ParseSeptentrio
+from blocks import novatel327, sbf4027, sbf4046
+
+
+def write_gzip(path, data):
+    with gzip.open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def flip(block, i):
+    block = bytearray(block)
+    block[i] ^= 0xff
+    return bytes(block)
+
+
+def frame(receiver, data, chunk_size):
+    framer = BlockFramer(receiver)
+    blocks = list()
+    for i in range(0, len(data), chunk_size):
+        blocks.extend(framer.feed(data[i:i+chunk_size]))
+    blocks.extend(framer.flush())
+    return framer, blocks
+
+
+# Each 327 block with 3 PRNs is 1296 bytes
+novatel = [novatel327([3, 7, 12], tow=1000*k) for k in range(10)]
+septentrio = [sbf4046([3, 9], tow=10*k) for k in range(10)]
+
+
+def test_novatel_corrupt_block(tmp_path):
+
+    # Body byte flipped in the middle of the file costs exactly one block
+    blocks = novatel.copy()
+    blocks[3] = flip(blocks[3], 200)
+    filename = write_gzip(tmp_path/'rx.gz', b''.join(blocks))
+
+    with pytest.warns(UserWarning, match='skipped 1296 bytes'):
+        parsed = ParseNovatel(filename)
+
+    assert parsed.tstmp_tec_tow == [1000*k for k in range(10) if k != 3]
+    assert parsed.bad_blocks == 1
+    assert parsed.bytes_skipped == 1296
+    assert parsed.skipped == [(3*1296, 1296)]
+    assert len(parsed.phase[3]) == 9*50
+
+
+def test_novatel_corrupt_length(tmp_path):
+
+    # MessageLength claims more data than is left in the file
+    blocks = novatel.copy()
+    block = bytearray(blocks[8])
+    block[8:10] = b'\xff\xff'
+    blocks[8] = bytes(block)
+    filename = write_gzip(tmp_path/'rx.gz', b''.join(blocks))
+
+    with pytest.warns(UserWarning):
+        parsed = ParseNovatel(filename)
+
+    assert parsed.tstmp_tec_tow == [1000*k for k in range(10) if k != 8]
+    assert parsed.bad_blocks == 1
+    assert parsed.skipped == [(8*1296, 1296)]
+
+
+def test_novatel_truncated_blocks(tmp_path):
+
+    # Truncated block in the middle of the file and one at the end
+    data = b''.join(novatel[:4]) + novatel[4][:500] + b''.join(novatel[5:]) + novatel[0][:40]
+    filename = write_gzip(tmp_path/'rx.gz', data)
+
+    with pytest.warns(UserWarning, match='skipped 540 bytes'):
+        parsed = ParseNovatel(filename)
+
+    assert parsed.tstmp_tec_tow == [1000*k for k in range(10) if k != 4]
+    assert parsed.bad_blocks == 2
+    assert parsed.skipped == [(4*1296, 500), (len(data)-40, 40)]
+
+
+def test_septentrio_corrupt_block(tmp_path):
+
+    # 4046 blocks with 2 satellites are 36 bytes
+    blocks = [sbf4027([3])] + septentrio
+    blocks[5] = flip(blocks[5], 20)
+    data = b'junk' + b''.join(blocks) + septentrio[0][:10]
+    filename = write_gzip(tmp_path/'rx.gz', data)
+
+    with pytest.warns(UserWarning, match='skipped 50 bytes'):
+        parsed = ParseSeptentrio(filename)
+
+    assert parsed.tstmp_tow == [10*k for k in range(10) if k != 4]
+    assert parsed.bad_blocks == 2
+    assert parsed.skipped == [(0, 4), (4+len(blocks[0])+4*36, 36), (len(data)-10, 10)]
+
+    # Carrier phase from the 4046 blocks plus the 4027 measurement
+    np.testing.assert_allclose(parsed.phase[2]['GPS_L1-CA'], 1.7)
+    assert np.isnan(parsed.phase[0]['GPS_L1-CA']).all()
+    assert parsed.power[2]['GPS_L1-CA'][0] == 261.**2 + 518.**2
+
+
+def test_undecodable_block(tmp_path):
+
+    # svid 71 (Galileo) passes the CRC check but is outside the GPS PRN range
+    blocks = septentrio.copy()
+    blocks[2] = sbf4046([71], tow=20)
+    filename = write_gzip(tmp_path/'rx.gz', b''.join(blocks))
+
+    with pytest.warns(UserWarning, match='1 blocks that could not be decoded'):
+        parsed = ParseSeptentrio(filename)
+
+    assert parsed.tstmp_tow == [10*k for k in range(10) if k != 2]
+    assert parsed.decode_errors == 1
+    assert parsed.bytes_skipped == 0
+
+
+@pytest.mark.parametrize('receiver, blocks', [('novatel', novatel), ('septentrio', septentrio)])
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 100, 1296, 100000])
+def test_chunk_size(receiver, blocks, chunk_size):
+
+    # Results do not depend on how the data is split, including sync patterns split across chunks
+    data = b'junk' + blocks[0] + flip(blocks[1], 30) + b''.join(blocks[2:]) + blocks[0][:20]
+    framer, framed = frame(receiver, data, chunk_size)
+    whole, framed_whole = frame(receiver, data, len(data))
+
+    assert framed == framed_whole == [blocks[0]] + blocks[2:]
+    assert list(framer.skipped) == list(whole.skipped)
+    assert framer.bad_blocks == whole.bad_blocks == 2
+    assert framer.bytes_skipped == 4 + len(blocks[1]) + 20
+    assert framer.offset == len(data)
+
+
+def test_split_sync():
+
+    sync = BlockFramer.sync['novatel']
+    framer = BlockFramer('novatel')
+    data = b'junk' + novatel[0]
+    assert framer.feed(data[:5]) == []
+    assert framer.feed(data[5:]) == [novatel[0]]
+    assert framer.bytes_skipped == 4
+    assert data[4:4+len(sync)] == sync
+
+
+@pytest.mark.parametrize('receiver, junk', [('novatel', b'\xaa\x44\x12\x00' + bytes(12)),
+                                            ('septentrio', b'$@\x00\x00\x00\x00\x03\x00')])
+def test_false_sync(receiver, junk):
+
+    # Sync patterns with impossible lengths are not counted as corrupt blocks
+    block = novatel[0] if receiver == 'novatel' else septentrio[0]
+    data = junk*5 + block + junk*5 + BlockFramer.sync[receiver]
+    framer, framed = frame(receiver, data, 64)
+
+    assert framed == [block]
+    assert framer.bad_blocks == 0
+    assert framer.bytes_skipped == len(data) - len(block)
+    assert list(framer.skipped) == [(0, 5*len(junk)), (5*len(junk)+len(block), 5*len(junk)+len(BlockFramer.sync[receiver]))]
+
+
+def test_max_skipped():
+
+    data = b''.join(b'junk' + block for block in septentrio)
+    framer, framed = frame('septentrio', data, 1000)
+
+    assert len(framed) == 10
+    assert framer.bytes_skipped == 40
+    assert list(framer.skipped) == [(40*k, 4) for k in range(10)]
+
+    framer = BlockFramer('septentrio', max_skipped=3)
+    framer.feed(data)
+    assert list(framer.skipped) == [(40*k, 4) for k in range(7, 10)]
+    assert framer.bytes_skipped == 40
@@ -0,0 +1,148 @@
+import glob
+import gzip
+import asyncio
+import pytest
+
+from gnss_scintillation.parse import ParseNovatel
+from gnss_scintillation.stream import StreamIngest
+from blocks import novatel_stream, sbf4046
+
+
+async def replay(data, chunk_size=777, hold=False):
+    # Local replay server sending data in chunks; if hold, keep the connection open afterwards
+
+    async def send(reader, writer):
+        for i in range(0, len(data), chunk_size):
+            writer.write(data[i:i+chunk_size])
+            await writer.drain()
+        if hold:
+            await asyncio.sleep(10)
+        writer.close()
+
+    server = await asyncio.start_server(send, '127.0.0.1', 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def consume(ingest, delay=0.):
+    epochs = list()
+    async for epoch in ingest.epochs():
+        epochs.append(epoch)
+        await asyncio.sleep(delay)
+    return epochs
+
+
+def test_block_overflow():
+
+    async def main():
+        server, port = await replay(b'junk' + novatel_stream(20))
+        ingest = StreamIngest('127.0.0.1', port, maxsize=3, chunk_size=1000)
+        task = asyncio.create_task(ingest.run())
+        epochs = await consume(ingest, delay=0.001)
+        await task
+        server.close()
+        return ingest, epochs
+
+    ingest, epochs = asyncio.run(main())
+    assert ingest.dropped == 0
+    assert [(e['block_id'], e['tow']) for e in epochs] == [(b, 1000*k) for k in range(20) for b in (327, 274)]
+    assert epochs[0]['tec'][2] == 10.
+
+
+def test_drop_overflow():
+
+    async def main():
+        server, port = await replay(novatel_stream(10))
+        ingest = StreamIngest('127.0.0.1', port, maxsize=4, overflow='drop')
+        # Consumer only starts once the stream has ended
+        await ingest.run()
+        epochs = await consume(ingest)
+        server.close()
+        return ingest, epochs
+
+    ingest, epochs = asyncio.run(main())
+    assert ingest.dropped == 17
+    assert [e['tow'] for e in epochs] == [8000, 9000, 9000]
+
+
+def test_archive_round_trip(tmp_path):
+
+    data = b'junk' + novatel_stream(5)
+
+    async def main():
+        server, port = await replay(data)
+        ingest = StreamIngest('127.0.0.1', port, archive=str(tmp_path/'rx_%Y%m%d_%H%M%S.gz'))
+        task = asyncio.create_task(ingest.run())
+        epochs = await consume(ingest)
+        await task
+        server.close()
+        return epochs
+
+    epochs = asyncio.run(main())
+    filename, = glob.glob(str(tmp_path/'rx_*.gz'))
+
+    with pytest.warns(UserWarning, match='skipped 4 bytes'):
+        parsed = ParseNovatel(filename)
+    assert parsed.tstmp_tec_tow == [e['tow'] for e in epochs if e['block_id'] == 327]
+    assert parsed.tstmp_pos_tow == [e['tow'] for e in epochs if e['block_id'] == 274]
+
+
+def test_undecodable_block_skipped():
+
+    # svid 71 (Galileo) is outside the GPS PRN range
+    data = sbf4046([3], tow=0) + sbf4046([71], tow=10) + sbf4046([5], tow=20)
+
+    async def main():
+        server, port = await replay(data)
+        ingest = StreamIngest('127.0.0.1', port, receiver='septentrio')
+        task = asyncio.create_task(ingest.run())
+        epochs = await consume(ingest)
+        await task
+        server.close()
+        return ingest, epochs
+
+    ingest, epochs = asyncio.run(main())
+    assert ingest.decode_errors == 1
+    assert [e['tow'] for e in epochs] == [0, 20]
+
+
+def test_connect_failure_ends_epochs():
+
+    async def main():
+        # Find a port with nothing listening
+        server = await asyncio.start_server(lambda r, w: None, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        server.close()
+        await server.wait_closed()
+
+        ingest = StreamIngest('127.0.0.1', port)
+        task = asyncio.create_task(ingest.run())
+        epochs = await asyncio.wait_for(consume(ingest), 2)
+        with pytest.raises(ConnectionRefusedError):
+            await task
+        return epochs
+
+    assert asyncio.run(main()) == []
+
+
+def test_cancel_with_full_queue(tmp_path):
+
+    async def main():
+        server, port = await replay(novatel_stream(10), hold=True)
+        ingest = StreamIngest('127.0.0.1', port, maxsize=2, archive=str(tmp_path/'rx_%Y%m%d_%H%M%S.gz'))
+        task = asyncio.create_task(ingest.run())
+        while not ingest.queue.full():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(task, 2)
+        epochs = await asyncio.wait_for(consume(ingest), 2)
+        server.close()
+        return epochs
+
+    assert len(asyncio.run(main())) == 1
+
+    # Archive was closed, so it is a complete gzip file
+    filename, = glob.glob(str(tmp_path/'rx_*.gz'))
+    with gzip.open(filename) as f:
+        archived = f.read()
+    assert archived and novatel_stream(10).startswith(archived)